@@ -6,23 +6,212 @@ generates necessary data points, restructures and reformats.
 It then clears the target Google Sheet (Manual Cost Uploader)
 and uploads the merged dataframes to the sheet.
 
-This script requires installation of 'gspread', 'oauth2client'
-and 'pandas'.
+This script requires installation of 'gspread', 'oauth2client',
+'orjson', 'pandas' and 'pyarrow'.
 """
 
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
 import datetime as dt
+import functools
 import json
-from io import StringIO
+import os
+import pathlib
 import sys
+import tempfile
+import threading
+import time
 
 import gspread
+import numpy as np
+import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from oauth2client.service_account import ServiceAccountCredentials
 
 import settings
 
 
+# Shared session so repeated calls to the same API reuse connections,
+# retrying rate-limited and failed requests with backoff. The last response
+# is returned rather than raised, so callers still handle the final status.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.5,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      raise_on_status=False)))
+
+# Explicit types for Criteo CSV columns, so nothing is left to inference
+CRITEO_COLUMN_TYPES = {
+    'AdvertiserId': pa.string(),
+    'Advertiser': pa.string(),
+    'Day': pa.string(),
+    'Device': pa.string(),
+    'Displays': pa.int64(),
+    'Clicks': pa.int64(),
+    'AdvertiserCost': pa.float64(),
+    'Currency': pa.string()
+}
+
+# Reporting window (previous two days) and timezone, fixed for the run
+START_DATE = (dt.date.today() - dt.timedelta(days=2)).isoformat()
+END_DATE = (dt.date.today() - dt.timedelta(days=1)).isoformat()
+TIMEZONE = f"{dt.datetime.now(dt.timezone.utc).astimezone().tzinfo}"
+
+# STATS REPORT - CRITEO
+CRITEO_REPORT_URL = "https://api.criteo.com/2022-04/statistics/report"
+CRITEO_REPORT_HEADERS = {
+    "Accept": "text/plain",
+    "Content-Type": "application/*+json"
+}
+CRITEO_REPORT_PAYLOAD = {
+    "dimensions": [
+        "Advertiser",
+        "Day",
+        "Device"
+    ],
+    "metrics": [
+        "Displays",
+        "Clicks",
+        "AdvertiserCost"
+    ],
+    "timezone": TIMEZONE,
+    "format": "CSV",
+    "startDate": START_DATE,
+    "endDate": END_DATE
+}
+
+# STATS REPORT - KELKOO
+KELKOO_REPORT_URL = ("https://api.kelkoogroup.net/merchant/statistics/v1/category/"
+                     f"{settings.KELKOO_CAMPAIGN_ID}?startDate={START_DATE}&endDate={END_DATE}")
+KELKOO_REPORT_HEADERS = {
+    "Accept": "text/plain",
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {settings.KELKOO_TOKEN}"
+}
+
+# Device labels from both APIs, standardised for grouping
+DEVICE_REPLACEMENTS = {
+    'Computer': 'desktop',
+    'Desktop': 'desktop',
+    'Mobile': 'mobile',
+    'Smartphone': 'mobile',
+    'Tablet': 'tablet',
+    'CTV': 'unknown',
+    'Other': 'unknown',
+    'Unknown': 'unknown'
+}
+
+# Column order expected by the upload sheet
+FINAL_COLUMNS = [
+    'date',
+    'device',
+    'impressions',
+    'clicks',
+    'billingcost',
+    'billingcurrency',
+    'costusd',
+    'engine',
+    'majormarket',
+    'channel'
+]
+
+# Auth tokens and FX rates are reused across runs until they expire. The
+# cache holds a bearer token, so it lives in a private per-user directory.
+CACHE_FILE = 'cache.json'
+# Seconds before a Criteo token's stated expiry that it stops being reused
+CRITEO_TOKEN_EXPIRY_MARGIN = 60
+_CACHE_LOCK = threading.Lock()
+
+
+def __cache_dir():
+    """Per-user cache directory, resolved when used so a missing home can't break imports."""
+    return pathlib.Path.home() / '.cache' / 'cost_uploader'
+
+
+def __read_cache():
+    """Load cached values from disk; a missing, unreadable or corrupt cache is empty."""
+    try:
+        return json.loads((__cache_dir() / CACHE_FILE).read_text())
+    except (OSError, RuntimeError, ValueError):
+        return {}
+
+
+def __write_cache(name, entry):
+    """Store (or with None, remove) a single cache entry on disk.
+
+    The cache is only an optimisation, so if it can't be written the
+    run carries on without it.
+    """
+    with _CACHE_LOCK:
+        cache = __read_cache()
+        if entry is None:
+            cache.pop(name, None)
+        else:
+            cache[name] = entry
+        try:
+            cache_dir = __cache_dir()
+            cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+            cache_dir.chmod(0o700)
+            # Write a private temp file and swap it in, so readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        except (OSError, RuntimeError):
+            return
+        try:
+            with os.fdopen(fd, 'w') as tmp_file:
+                json.dump(cache, tmp_file)
+            os.replace(tmp_path, cache_dir / CACHE_FILE)
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+
+
+def __ttl_cache(ttl_seconds=None, key=lambda: None):
+    """Cache a function's result on disk for ttl_seconds, per key.
+
+    Without a fixed ttl_seconds the function returns a (value, ttl_seconds)
+    pair, and only the value is passed on to callers.
+    """
+    def decorator(func):
+        lock = threading.Lock()
+
+        @functools.wraps(func)
+        def wrapper():
+            cache_key = str(key())
+            with lock:
+                entry = __read_cache().get(func.__name__)
+                if entry and entry['key'] == cache_key and entry['expires'] > time.time():
+                    return entry['value']
+                if ttl_seconds is None:
+                    value, ttl = func()
+                else:
+                    value, ttl = func(), ttl_seconds
+                if ttl > 0:
+                    __write_cache(func.__name__, {
+                        'key': cache_key,
+                        'expires': time.time() + ttl,
+                        'value': value
+                    })
+            return value
+
+        def cache_clear(stale_value):
+            """Drop the cached value, unless another caller already replaced it."""
+            with lock:
+                entry = __read_cache().get(func.__name__)
+                if entry and entry['value'] == stale_value:
+                    __write_cache(func.__name__, None)
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
+
+
 def prep_sheet():
     """Google sheet authorisation."""
     gsheet_creds = json.loads((settings.GSHEET), strict=False)
@@ -34,13 +223,13 @@ def prep_sheet():
 
     spreadsheet = client.open_by_key(settings.GSHEET_KEY)
     worksheet = spreadsheet.get_worksheet(0)
-    worksheet.batch_clear(["A:J"])
     return worksheet
 
 
 
+@__ttl_cache(key=lambda: settings.CRITEO_CLIENT_ID)
 def __criteo_get_auth():
-    """Criteo API authorisation"""
+    """Criteo API authorisation; cached until shortly before the token expires"""
     auth_url = "https://api.criteo.com/oauth2/token"
 
     auth_payload = (
@@ -51,10 +240,11 @@ def __criteo_get_auth():
         "Content-Type": "application/x-www-form-urlencoded"
     }
     try:
-        auth_response = requests.post(auth_url, data=auth_payload,
+        auth_response = _SESSION.post(auth_url, data=auth_payload,
                                       headers=auth_headers, timeout=120)
-        json_auth = json.loads(auth_response.text)
-        return json_auth["access_token"]
+        json_auth = orjson.loads(auth_response.content)
+        expires_in = json_auth.get("expires_in", 0) - CRITEO_TOKEN_EXPIRY_MARGIN
+        return json_auth["access_token"], expires_in
     except Exception as e:
         print('Auto Cost Uploader has failed - Criteo API connection error.')
         raise e
@@ -63,48 +253,44 @@ def __criteo_get_auth():
 def __criteo_get_csv(token, payload_edits):
     """Generate data from Criteo API request:
 
-    * Set endpoint parameters
-    * Set template paylod with edit options
-    * Generate CSV report
+    * Apply edit options to the template payload
+    * Generate CSV report, returned as an unread streamed response
     """
-    start_date = (dt.date.today() - dt.timedelta(days=2)).isoformat()
-    end_date = (dt.date.today() - dt.timedelta(days=1)).isoformat()
-    timezone = dt.datetime.now(dt.timezone.utc).astimezone().tzinfo
-
-    # STATS REPORT - CRITEO
-    url = "https://api.criteo.com/2022-04/statistics/report"
-
-    headers = {
-        "Accept": "text/plain",
-        "Content-Type": "application/*+json",
-        "Authorization": f"Bearer {token}"
-    }
-
-    payload = {
-        "dimensions": [
-            "Advertiser",
-            "Day",
-            "Device"
-        ],
-        "metrics": [
-            "Displays",
-            "Clicks",
-            "AdvertiserCost"
-        ],
-        "timezone": f"{timezone}",
-        "format": "CSV",
-        "startDate": f"{start_date}",
-        "endDate": f"{end_date}",
-        **payload_edits
-    }
-
-    response = requests.post(url, data=json.dumps(payload), headers=headers, timeout=120)
-    return response.content.decode('utf-8-sig')
-
-
-def __criteo_create_dataframes(stats, cols):
-    """Build initial dataframe from CSV data."""
-    criteo_df = pd.read_csv(StringIO(stats), sep=';').drop(columns=['AdvertiserId'])
+    headers = {**CRITEO_REPORT_HEADERS, "Authorization": f"Bearer {token}"}
+    payload = orjson.dumps({**CRITEO_REPORT_PAYLOAD, **payload_edits})
+
+    response = _SESSION.post(CRITEO_REPORT_URL, data=payload, headers=headers,
+                             stream=True, timeout=120)
+    if response.status_code == 401:
+        # Token was revoked before its stated expiry - refresh it and retry once
+        response.close()
+        __criteo_get_auth.cache_clear(token)
+        headers["Authorization"] = f"Bearer {__criteo_get_auth()}"
+        response = _SESSION.post(CRITEO_REPORT_URL, data=payload, headers=headers,
+                                 stream=True, timeout=120)
+    try:
+        response.raise_for_status()
+    except requests.HTTPError as e:
+        response.close()
+        print('Auto Cost Uploader has failed - Criteo API report error.')
+        raise e
+    response.raw.decode_content = True
+    return response
+
+
+def __criteo_create_dataframes(stats, cols, metrics):
+    """Build initial dataframe from CSV data; None if the report is empty."""
+    table = pacsv.read_csv(
+        stats,
+        parse_options=pacsv.ParseOptions(delimiter=';'),
+        convert_options=pacsv.ConvertOptions(
+            column_types=CRITEO_COLUMN_TYPES,
+            include_columns=['AdvertiserId', 'Advertiser', 'Day', 'Device', *metrics, 'Currency'],
+            strings_can_be_null=True))
+    if table.num_rows == 0:
+        return None
+    # Nullable integers keep counts whole when other reports lack them
+    criteo_df = table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
     criteo_df = criteo_df[criteo_df['Device'].notna()]
     criteo_df.rename(
         columns=cols,
@@ -113,23 +299,27 @@ def __criteo_create_dataframes(stats, cols):
     return criteo_df
 
 
-def __criteo_merge_and_format_dataframes(df_usd, df_eur, df_gbp):
-    """Merge, reformat and restructure 3 dataframes"""
-    df_merged = pd.merge(df_usd, df_eur,
-                         on=['Advertiser', 'Day', 'Device'], how='outer')
-    df_merged = pd.merge(df_merged, df_gbp,
-                         on=['Advertiser', 'Day', 'Device'], how='outer')
-
-    if df_merged['Advertiser'].dropna().empty:
-        return None
+def __replace_categories(series, replacements):
+    """Replace values via the column's categories rather than row by row."""
+    return series.astype('category').map(lambda value: replacements.get(value, value))
 
-    df_merged['billingcurrency'] = df_merged['billingcurrency_gbp'].fillna(
-        df_merged['billingcurrency_eur']).fillna(df_merged['billingcurrency'])
-    df_merged['billingcost'] = df_merged['billingcost_gbp'].fillna(
-        df_merged['billingcost_eur']).fillna(df_merged['costusd'])
 
-    df_merged['engine'] = 'Criteo'
-    df_merged['channel'] = 'Retargeting'
+def __criteo_merge_and_format_dataframes(df_usd, df_eur, df_gbp):
+    """Stack, reformat and restructure 3 dataframes"""
+    # Billing cost/currency comes from GBP, then EUR, then USD reports.
+    # Empty GBP/EUR reports are None, which concat skips.
+    df_usd = df_usd.assign(billingcost=df_usd['costusd'], currency_priority=2)
+    if df_eur is not None:
+        df_eur = df_eur.assign(currency_priority=1)
+    if df_gbp is not None:
+        df_gbp = df_gbp.assign(currency_priority=0)
+    df_merged = pd.concat([df_gbp, df_eur, df_usd]).sort_values('currency_priority')
+    # Advertiser names aren't unique, so rows are matched on the id
+    df_merged = df_merged.groupby(['AdvertiserId', 'Advertiser', 'Day', 'Device'],
+                                  as_index=False, sort=False, dropna=False).first()
+
+    if not df_merged['Advertiser'].notna().any():
+        return None
 
     df_merged.rename(columns={
         'Day': 'date',
@@ -138,90 +328,83 @@ def __criteo_merge_and_format_dataframes(df_usd, df_eur, df_gbp):
         'Clicks': 'clicks',
         'Advertiser': 'majormarket'
     }, inplace=True)
-    df_merged['majormarket'].replace(settings.CRITEO_MARKET_REPLACEMENTS, inplace=True)
-
-    df_merged['device'] = df_merged['device'].replace({
-        'Desktop': 'desktop',
-        'Tablet': 'tablet',
-        'CTV': 'unknown',
-        'Other': 'unknown',
-        'Smartphone': 'mobile',
-        'Unknown': 'unknown'
-    })
-    final_df = df_merged.groupby(['date',
-                                  'device',
-                                  'majormarket',
-                                  'channel'],
-                                 as_index=False
+    df_merged['majormarket'] = __replace_categories(
+        df_merged['majormarket'], settings.CRITEO_MARKET_REPLACEMENTS)
+
+    df_merged['device'] = __replace_categories(df_merged['device'], DEVICE_REPLACEMENTS)
+
+    # Categorical keys let the groupby hash integer codes, not strings
+    group_columns = ['date', 'device', 'majormarket']
+    df_merged[group_columns] = df_merged[group_columns].astype('category')
+    final_df = df_merged.groupby(group_columns,
+                                 as_index=False,
+                                 observed=True
                                  ).agg({'impressions': 'sum',
                                         'clicks': 'sum',
                                         'billingcost': 'sum',
-                                        'billingcurrency': 'max',
-                                        'costusd': 'sum',
-                                        'engine': 'max'}
+                                        'billingcurrency': 'first',
+                                        'costusd': 'sum'}
                                        )
-    final_df = final_df[['date',
-                         'device',
-                         'impressions',
-                         'clicks',
-                         'billingcost',
-                         'billingcurrency',
-                         'costusd',
-                         'engine',
-                         'majormarket',
-                         'channel']
-                        ].round(decimals=2)
+    final_df['engine'] = 'Criteo'
+    final_df['channel'] = 'Retargeting'
     return final_df
 
 
+def __criteo_get_dataframe(token, payload_edits, cols):
+    """Stream a Criteo CSV report straight into a dataframe."""
+    with __criteo_get_csv(token, payload_edits) as response:
+        return __criteo_create_dataframes(response.raw, cols, payload_edits['metrics'])
+
+
 def criteo_build_final_dataframe():
     """Build final Criteo dataframe for upload:
 
     * Generate authorisation token
-    * Create payloads for each currency
-    * Build dataframes for each currency
-    * Merge dataframes together and reformat
+    * Request and build dataframes for each currency concurrently
+    * Stack dataframes together and reformat
     """
     token = __criteo_get_auth()
 
     usd_edits = {
         "metrics": ["Displays", "Clicks", "AdvertiserCost"],
         "currency": "USD"}
-    stats_usd = __criteo_get_csv(token, usd_edits)
-
     gbp_edits = {
         "advertiserIds": settings.CRITEO_GBP_IDS,
         "metrics": ["AdvertiserCost"],
         "currency": "GBP"}
-    stats_gbp = __criteo_get_csv(token, gbp_edits)
-
     eur_edits = {
         "advertiserIds": settings.CRITEO_EUR_IDS,
         "metrics": ["AdvertiserCost"],
         "currency": "EUR"}
-    stats_eur = __criteo_get_csv(token, eur_edits)
 
-    # CREATE DATAFRAMES
     columns_usd = {
         'AdvertiserCost': 'costusd',
         'Currency': 'billingcurrency',
     }
-    df_usd = __criteo_create_dataframes(stats_usd, columns_usd)
-
     columns_eur = {
-        'AdvertiserCost': 'billingcost_eur',
-        'Currency': 'billingcurrency_eur',
+        'AdvertiserCost': 'billingcost',
+        'Currency': 'billingcurrency',
     }
-    df_eur = __criteo_create_dataframes(stats_eur, columns_eur)
-
     columns_gbp = {
-        'AdvertiserCost': 'billingcost_gbp',
-        'Currency': 'billingcurrency_gbp',
+        'AdvertiserCost': 'billingcost',
+        'Currency': 'billingcurrency',
     }
-    df_gbp = __criteo_create_dataframes(stats_gbp, columns_gbp)
+
+    # Reports are independent, so request and parse them concurrently
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        future_usd = executor.submit(__criteo_get_dataframe, token, usd_edits, columns_usd)
+        future_gbp = executor.submit(__criteo_get_dataframe, token, gbp_edits, columns_gbp)
+        future_eur = executor.submit(__criteo_get_dataframe, token, eur_edits, columns_eur)
+    df_usd = future_usd.result()
+    df_gbp = future_gbp.result()
+    df_eur = future_eur.result()
+    # The USD report covers every advertiser, so without it there is no data
+    if df_usd is None:
+        return None
     return __criteo_merge_and_format_dataframes(df_usd, df_eur, df_gbp)
 
 
+@__ttl_cache(ttl_seconds=86400, key=lambda: dt.date.today().isoformat())
 def __fixer_get_conversion_rate():
     """Generate latest GBP > USD conversion rate."""
     url_fx = "https://api.apilayer.com/fixer/latest?symbols=USD&base=GBP"
@@ -231,59 +414,50 @@ def __fixer_get_conversion_rate():
         "apikey": f"{settings.FIXER_KEY}"
     }
 
-    response_fx = requests.request("GET", url_fx, headers=headers_fx, data=payload_fx, timeout=120)
+    response_fx = _SESSION.request("GET", url_fx, headers=headers_fx, data=payload_fx, timeout=120)
+    if response_fx.status_code != 200:
+        print("Auto Cost Uploader has failed - Fixer API connection error")
+        sys.exit()
 
-    result = response_fx.json()
+    result = orjson.loads(response_fx.content)
     return result['rates']['USD']
 
 
 def __kelkoo_get_json():
     """Generate data from Kelkoo API request:
 
-    * Set endpoint parameters
-    * Generate JSON report
+    * Generate JSON report, or None if it has no records
     """
-    start_date = (dt.date.today() - dt.timedelta(days=2)).isoformat()
-    end_date = (dt.date.today() - dt.timedelta(days=1)).isoformat()
-    campaign_id = settings.KELKOO_CAMPAIGN_ID
-
-    url = ("https://api.kelkoogroup.net/merchant/statistics/v1/category/"
-           f"{campaign_id}?startDate={start_date}&endDate={end_date}")
-    token = f"{settings.KELKOO_TOKEN}"
-    headers = {
-        "Accept": "text/plain",
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {token}"
-    }
-
-    response = requests.get(url, headers=headers, timeout=120)
+    response = _SESSION.get(KELKOO_REPORT_URL, headers=KELKOO_REPORT_HEADERS, timeout=120)
     if response.status_code != 200:
         print("Auto Cost Uploader has failed - Kelkoo API connection error")
         sys.exit()
+    elif response.content == b'[]':
+        return None
     else:
-        return response.text
+        return response.content
 
 
-def __kelkoo_create_dataframe():
-    """Build initial dataframe from CSV data."""
-    kelkoo_json_data = __kelkoo_get_json()
-    if kelkoo_json_data == '[]':
+def __kelkoo_create_dataframe(kelkoo_json_data):
+    """Build initial dataframe from the JSON fields that are used."""
+    records = orjson.loads(kelkoo_json_data)
+    if not records:
         return None
-    kelkoo_df = pd.read_json(kelkoo_json_data)
-    kelkoo_df['date'] = kelkoo_df['date'].astype(str)
+    # Dates stay as the API's ISO strings, ready for upload
+    kelkoo_df = pd.DataFrame.from_records(
+        records, columns=['date', 'deviceType', 'cost', 'currency', 'clicks'])
     return kelkoo_df
 
 
-def __kelkoo_format_and_group_dataframe(usd_rate):
+def __kelkoo_format_and_group_dataframe(kelkoo_json_data, usd_rate):
     """Reformat and group data:
 
     * Rename columns
-    * Drop unwanted columns
     * Standardise device labels for grouping
     * Group data by date & device
     * Create new columns
     """
-    kelkoo_df = __kelkoo_create_dataframe()
+    kelkoo_df = __kelkoo_create_dataframe(kelkoo_json_data)
     if kelkoo_df is None:
         return None
 
@@ -293,34 +467,16 @@ def __kelkoo_format_and_group_dataframe(usd_rate):
             'currency': 'billingcurrency',
             'deviceType': 'device'},
         inplace=True)
-    kelkoo_df.drop(
-        columns=[
-            'catId',
-            'catName',
-            'sales',
-            'orderValue',
-            'trackedLeads',
-            'costTrackedLeads'],
-        inplace=True)
-    kelkoo_df['device'] = kelkoo_df['device'].replace({
-        'Computer': 'desktop',
-        'Desktop': 'desktop',
-        'Mobile': 'mobile',
-        'Tablet': 'tablet',
-        'CTV': 'unknown',
-        'Other': 'unknown',
-        'Smartphone': 'mobile',
-        'Unknown': 'unknown'
-    })
+    kelkoo_df['device'] = __replace_categories(kelkoo_df['device'], DEVICE_REPLACEMENTS)
 
-    df_grouped = kelkoo_df.groupby(['date', 'device']).agg(
-        {'billingcurrency': 'max', 'clicks': 'sum', 'billingcost': 'sum'})
+    kelkoo_df[['date', 'device']] = kelkoo_df[['date', 'device']].astype('category')
+    df_grouped = kelkoo_df.groupby(['date', 'device'], observed=True).agg(
+        {'billingcurrency': 'first', 'clicks': 'sum', 'billingcost': 'sum'})
     df_grouped = df_grouped.reset_index()
 
     df_grouped['impressions'] = 0
-    df_grouped['costusd'] = df_grouped['billingcost'] * usd_rate
-    df_grouped = df_grouped[['date', 'device', 'impressions', 'clicks',
-                            'billingcost', 'billingcurrency', 'costusd']].round(decimals=2)
+    df_grouped['billingcost'] = df_grouped['billingcost'].astype('float64', copy=False)
+    df_grouped['costusd'] = df_grouped['billingcost'].to_numpy() * np.float64(usd_rate)
     df_grouped['engine'] = 'Kelkoo'
     df_grouped['majormarket'] = 'UK'
     df_grouped['channel'] = 'Affiliate'
@@ -328,47 +484,82 @@ def __kelkoo_format_and_group_dataframe(usd_rate):
 
 
 def kelkoo_build_final_dataframe():
-    """Generate USD rate; build final grouped dataframe."""
-    usd_conversion_rate = __fixer_get_conversion_rate()
-    kelkoo_df = __kelkoo_format_and_group_dataframe(usd_conversion_rate)
+    """Generate USD rate and Kelkoo report concurrently; build final grouped dataframe."""
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        future_rate = executor.submit(__fixer_get_conversion_rate)
+        future_json = executor.submit(__kelkoo_get_json)
+    kelkoo_json_data = future_json.result()
+    if kelkoo_json_data is None:
+        return None
+    kelkoo_df = __kelkoo_format_and_group_dataframe(kelkoo_json_data, future_rate.result())
     if kelkoo_df is None:
         return None
     return kelkoo_df
 
 
+def __finalize_dataframe(merged_df):
+    """Order columns for upload and round cost values."""
+    merged_df = merged_df[FINAL_COLUMNS]
+    # Only the cost columns hold decimals
+    for column in ('billingcost', 'costusd'):
+        merged_df[column] = np.round(merged_df[column].to_numpy(), 2)
+    return merged_df
+
+
 def merge_dataframes(criteo_df, kelkoo_df):
-    """Concat Criteo & Kelkoo dataframes, rename devices."""
+    """Concat Criteo & Kelkoo dataframes, order columns and round costs."""
     if criteo_df is None and kelkoo_df is None:
         print("Auto Cost Uploader has failed - no data provided.")
         sys.exit()
     if criteo_df is None:
-        return kelkoo_df
+        return __finalize_dataframe(kelkoo_df)
     if kelkoo_df is None:
-        return criteo_df
-    return pd.concat([criteo_df, kelkoo_df])
+        return __finalize_dataframe(criteo_df)
+    if set(criteo_df.columns) != set(kelkoo_df.columns):
+        return __finalize_dataframe(pd.concat([criteo_df, kelkoo_df]))
+    # Frames are small, so one array copy beats pandas block consolidation
+    merged_values = np.concatenate(
+        [criteo_df.to_numpy(), kelkoo_df[criteo_df.columns].to_numpy()])
+    merged_df = pd.DataFrame(merged_values, columns=criteo_df.columns).infer_objects()
+    return __finalize_dataframe(merged_df)
 
 
 def gsheet_upload(worksheet, merged_dataframe):
-    """Update Google sheet with merged dataframe values"""
-    worksheet.update(
-        [merged_dataframe.columns.values.tolist()] + merged_dataframe.values.tolist(), value_input_option="USER_ENTERED"
-    )
+    """Clear columns A:J and paste merged dataframe values in one request"""
+    worksheet.spreadsheet.batch_update({
+        'requests': [{
+            'updateCells': {
+                'range': {'sheetId': worksheet.id, 'startColumnIndex': 0, 'endColumnIndex': 10},
+                'fields': 'userEnteredValue'
+            }
+        }, {
+            'pasteData': {
+                'coordinate': {'sheetId': worksheet.id, 'rowIndex': 0, 'columnIndex': 0},
+                'data': merged_dataframe.to_csv(index=False),
+                'type': 'PASTE_NORMAL',
+                'delimiter': ','
+            }
+        }]
+    })
 
 
 def sheet_upload():
     """Run all functions:
 
-    * Generate final dataframes
+    * Generate final dataframes concurrently
     * Merge dataframes together
-    * Clear target sheet
-    * Upload merged dataframe to sheet
+    * Clear target sheet and upload merged dataframe in one request
     """
-    criteo_df = criteo_build_final_dataframe()
-    kelkoo_df = kelkoo_build_final_dataframe()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        future_criteo = executor.submit(criteo_build_final_dataframe)
+        future_kelkoo = executor.submit(kelkoo_build_final_dataframe)
+    criteo_df = future_criteo.result()
+    kelkoo_df = future_kelkoo.result()
     merged_df = merge_dataframes(criteo_df, kelkoo_df)
     worksheet = prep_sheet()
     gsheet_upload(worksheet, merged_df)
     print("Finished - check sheet.")
 
 
-sheet_upload()
+if __name__ == '__main__':
+    sheet_upload()